@@ -1,18 +1,18 @@
 # python/src/agent/customer_support_agent.py
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
 from smolagents import CodeAgent, OpenAIServerModel
 
 # Fixed tools (ensure each tool has a good docstring so smolagents can auto-describe it)
-from agent.tools.sql_tool import SQLLastOrdersTool, SQLOrderByIdTool, SQLOrdersInRangeTool
+from agent.tools.sql_tool import SQLOrdersTool
 from agent.tools.rag_tool import RAGDocSearchTool, RAGProductSearchTool
 from agent.tools.shipping_tool import ShippingStatusTool
 
-from db.iris_client import IRISClient
-
 class CustomerSupportAgent:
     """
     Minimal Customer Support agent using smolagents.CodeAgent.
@@ -39,18 +39,21 @@ class CustomerSupportAgent:
             api_base=api_base,
         )
 
-        # Fixed toolset
-        iris_client = IRISClient()
-        sql_last_order_tool = SQLLastOrdersTool(db=iris_client) 
-        sql_order_by_id_tool = SQLOrderByIdTool(db=iris_client)
-        sql_orders_in_range_tool = SQLOrdersInRangeTool(db=iris_client)
-        rag_doc_search_tool = RAGDocSearchTool(db=iris_client)
-        rag_product_search_tool = RAGProductSearchTool(db=iris_client)
+        # Fixed toolset (tools share the process-wide IRIS connection pool).
+        # One unified order tool: fewer prompt tokens and tool-choice steps.
+        sql_orders_tool = SQLOrdersTool()
+        rag_doc_search_tool = RAGDocSearchTool()
+        rag_product_search_tool = RAGProductSearchTool()
         shipping_status_tool = ShippingStatusTool()
 
+        # CodeAgent is stateful (memory.steps, executor state), so one
+        # instance must never run two requests at once; run() serializes on
+        # this lock and run_batch_async uses a fresh agent per task instead.
+        self._run_lock = threading.Lock()
+
         # Let smolagents use its default system prompt and auto-describe tools from docstrings
         self.agent = CodeAgent(
-            tools=[sql_last_order_tool, sql_order_by_id_tool, sql_orders_in_range_tool, rag_doc_search_tool, rag_product_search_tool, shipping_status_tool],
+            tools=[sql_orders_tool, rag_doc_search_tool, rag_product_search_tool, shipping_status_tool],
             additional_authorized_imports=['datetime', 'os', 'json', 'requests', 're', 'math'],
             model=model,
             max_steps=max_steps,
@@ -72,10 +75,115 @@ class CustomerSupportAgent:
             "Format your final answer in nice markdown"
         )
 
-    def run(self, user_email: str, message: str) -> Dict[str, Any]:
+    def _collect_debug_events(self) -> List[Dict[str, Any]]:
+        """
+        Extract structured step events from the agent's memory after a run.
+        Every attribute is read with getattr so this degrades to fewer fields
+        (never an exception) across smolagents versions.
+        """
+        events: List[Dict[str, Any]] = []
+        steps = getattr(getattr(self.agent, "memory", None), "steps", None) or []
+        for step in steps:
+            event: Dict[str, Any] = {"kind": type(step).__name__}
+            number = getattr(step, "step_number", None)
+            if number is not None:
+                event["step"] = number
+            thought = getattr(step, "model_output", None)
+            if thought:
+                event["thought"] = str(thought)
+            event["tool_calls"] = [
+                {"name": getattr(c, "name", None), "args": getattr(c, "arguments", None)}
+                for c in (getattr(step, "tool_calls", None) or [])
+            ]
+            observations = getattr(step, "observations", None)
+            if observations:
+                event["observation"] = str(observations)
+            error = getattr(step, "error", None)
+            if error:
+                event["error"] = str(error)
+            events.append(event)
+        return events
+
+    def run(
+        self,
+        user_email: str,
+        message: str,
+        debug_sink: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run one request. When `debug_sink` is given, structured step events
+        (kind/step/thought/tool_calls/observation/error dicts) are appended to
+        it after the run — callers get the trace without capturing stdout.
+        """
         task = self._compose_task(user_email, message)
-        answer = self.agent.run(task)
+        with self._run_lock:
+            answer = self.agent.run(task)
+            if debug_sink is not None:
+                debug_sink.extend(self._collect_debug_events())
         return {"answer": answer}
 
+    async def run_async(self, user_email: str, message: str) -> Dict[str, Any]:
+        """
+        Async wrapper around `run` (the ReAct loop itself is synchronous, so it
+        is moved off the event loop with asyncio.to_thread).
+        """
+        return await asyncio.to_thread(self.run, user_email, message)
+
+    async def run_batch_async(self, msgs: Iterable[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Run several independent (user_email, message) requests concurrently.
+        Wall-clock time becomes ~max instead of sum of the individual runs,
+        since tool I/O (IRIS SQL, HTTP, OpenAI) overlaps across requests.
+        Each task gets its own CustomerSupportAgent — the smolagents run
+        loop is stateful, so sharing self.agent would interleave memories;
+        construction is cheap next to a run, and tools still share the
+        process-wide IRIS pool.
+        """
+
+        def _run_one(user_email: str, message: str) -> Dict[str, Any]:
+            return CustomerSupportAgent().run(user_email, message)
+
+        return list(
+            await asyncio.gather(
+                *[asyncio.to_thread(_run_one, user_email, message) for user_email, message in msgs]
+            )
+        )
+
     def __call__(self, user_email: str, message: str) -> Dict[str, Any]:
         return self.run(user_email=user_email, message=message)
+
+
+# ------------------------- Process-wide singleton -------------------------
+
+_AGENT_LOCK = threading.Lock()
+_AGENT_CACHE: Dict[Tuple[str, ...], "CustomerSupportAgent"] = {}
+
+# Env vars that feed agent construction; a change in any of them yields a
+# different cache key (and thus a fresh agent).
+_ENV_KEYS = (
+    "OPENAI_API_KEY",
+    "OPENAI_MODEL",
+    "OPENAI_TEMPERATURE",
+    "OPENAI_API_BASE",
+    "AGENT_MAX_STEPS",
+    "AGENT_VERBOSITY",
+)
+
+
+def _env_fingerprint() -> Tuple[str, ...]:
+    return tuple(os.getenv(k, "") for k in _ENV_KEYS)
+
+
+def get_agent() -> "CustomerSupportAgent":
+    """
+    Return the cached agent for the current configuration, building it on
+    first use. Reusing one instance keeps the OpenAI HTTP session (and its
+    kept-alive connections) warm instead of re-doing client setup per
+    request; the lock makes this safe from concurrent handlers.
+    """
+    key = _env_fingerprint()
+    with _AGENT_LOCK:
+        agent = _AGENT_CACHE.get(key)
+        if agent is None:
+            agent = _AGENT_CACHE[key] = CustomerSupportAgent()
+        return agent
@@ -0,0 +1,105 @@
+# agent/embed_cache.py
+from __future__ import annotations
+
+import hashlib
+import os
+import shelve
+import threading
+from typing import List, Optional
+
+"""
+Client-side query-embedding cache.
+
+Embeds query text with a direct (batched) OpenAI call instead of routing it
+through EMBEDDING() inside IRIS, and persists sha256(model, text) -> vector
+in a shelve file so repeat queries survive process restarts. The model set
+via OPENAI_EMBEDDING_MODEL must match the one behind the IRIS EMBEDDING
+config (same dimensionality), since both write vectors into the same
+VECTOR(FLOAT, 1536) columns.
+"""
+
+_CACHE_PATH = os.getenv(
+    "EMBED_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "support_agent", "emb.db"),
+)
+_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+_LOCK = threading.Lock()
+_STORE: Optional[shelve.Shelf] = None
+_CLIENT = None  # openai.OpenAI, created lazily
+
+
+def enabled() -> bool:
+    """
+    Client-side embedding is opt-in: set EMBED_CLIENT_SIDE=1 and point
+    OPENAI_EMBEDDING_MODEL at the same model as the IRIS EMBEDDING config.
+    Keying on the API key alone would silently bypass EMBEDDING_CONFIG_NAME
+    whenever the chat agent runs (it always has a key) — wrong by an entire
+    vector space for non-OpenAI configs like the README's ollama-nomic-config
+    (768-dim). Requires an OpenAI key (openai ships with smolagents[openai]).
+    """
+    return os.getenv("EMBED_CLIENT_SIDE", "0") == "1" and bool(os.getenv("OPENAI_API_KEY"))
+
+
+def _store() -> shelve.Shelf:
+    global _STORE
+    if _STORE is None:
+        os.makedirs(os.path.dirname(_CACHE_PATH), exist_ok=True)
+        _STORE = shelve.open(_CACHE_PATH)
+    return _STORE
+
+
+def _client():
+    global _CLIENT
+    if _CLIENT is None:
+        from openai import OpenAI
+
+        _CLIENT = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1"),
+        )
+    return _CLIENT
+
+
+def _key(text: str) -> str:
+    return hashlib.sha256(f"{_MODEL}\x00{text}".encode()).hexdigest()
+
+
+def _vector_literal(values: List[float]) -> str:
+    """Render a vector the way TO_VECTOR(?) expects it: '[v1,v2,...]'."""
+    return "[" + ",".join(str(float(v)) for v in values) + "]"
+
+
+def embed_many(texts: List[str]) -> List[str]:
+    """
+    Return vector literals for `texts`, calling OpenAI once for all cache
+    misses (providers charge and rate-limit per request, so one batched call
+    beats N single ones).
+    """
+    with _LOCK:
+        store = _store()
+        out: List[Optional[str]] = [store.get(_key(t)) for t in texts]
+        misses = [i for i, v in enumerate(out) if v is None]
+        if misses:
+            resp = _client().embeddings.create(
+                model=_MODEL, input=[texts[i] for i in misses]
+            )
+            for i, item in zip(misses, resp.data):
+                vec = _vector_literal(item.embedding)
+                store[_key(texts[i])] = vec
+                out[i] = vec
+            store.sync()
+        return [v for v in out if v is not None]
+
+
+def get_embedding(text: str) -> str:
+    """Return the vector literal for one query (cache hit costs no HTTP call)."""
+    return embed_many([text])[0]
+
+
+def warm_embeddings(queries: List[str]) -> None:
+    """Populate the cache for a list of queries in a single batched call."""
+    embed_many(queries)
+
+
+__all__ = ["enabled", "get_embedding", "embed_many", "warm_embeddings"]
@@ -0,0 +1,33 @@
+# agent/tools/_json.py
+from __future__ import annotations
+
+import json
+import os
+from typing import Any
+
+import msgspec
+
+# Pretty output is debug-only: indentation and key sorting cost CPU and
+# inflate the token count of every tool observation sent back to the LLM.
+_PRETTY = os.getenv("AGENT_JSON_PRETTY", "0") == "1"
+
+# One reusable C-level encoder; enc_hook covers driver types like
+# datetime/Decimal the same way default=str used to.
+_ENCODER = msgspec.json.Encoder(enc_hook=str)
+
+
+def dump_json(obj: Any) -> str:
+    """
+    Serialize a tool payload (dicts and msgspec.Struct values) to JSON.
+
+    Compact msgspec encoding by default; set AGENT_JSON_PRETTY=1 to fall
+    back to indented, key-sorted stdlib output for CLI debugging.
+    """
+    if _PRETTY:
+        return json.dumps(
+            msgspec.to_builtins(obj, enc_hook=str), indent=4, sort_keys=True, default=str
+        )
+    return _ENCODER.encode(obj).decode()
+
+
+__all__ = ["dump_json"]
@@ -1,23 +1,75 @@
 # agent/tools/rag_tool.py
 from __future__ import annotations
 
-import json
+import functools
 import os
-import re
-from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
 
+import msgspec
 from smolagents import Tool
 from db.iris_client import IRISClient
+from db.pool import get_pool
+from db.util import validate_config_name
+from agent import embed_cache
+from agent.tools._json import dump_json
 
-_JSON = dict(indent=4, sort_keys=True, default=str)
+@functools.lru_cache(maxsize=1024)
+def _embed_query(cfg: str, query: str) -> str:
+    """
+    Compute the embedding for (config, normalized query) once and cache it.
+
+    Misses go to the persistent client-side cache first (agent/embed_cache:
+    direct OpenAI call, shelve-backed so it survives restarts) and only fall
+    back to EMBEDDING() inside IRIS when that path is unavailable. Hits skip
+    every round-trip and the cached vector is re-bound via TO_VECTOR(?).
+    `cfg` must already be validated (it is inlined in the SQL text).
+    """
+    if embed_cache.enabled():
+        try:
+            return embed_cache.get_embedding(query)
+        except Exception:
+            pass  # fall back to in-IRIS EMBEDDING()
+    # EMBEDDING() runs on a pooled connection like every other query; the
+    # cached-cursor client is not safe to share between concurrent handlers.
+    sql = f"SELECT EMBEDDING(?, '{cfg}') AS v"
+    with get_pool().connection() as db:
+        try:
+            row = db.query_one(sql, [query])
+        except Exception:
+            db.reconnect()
+            row = db.query_one(sql, [query])
+    if not row or row.get("v") is None:
+        raise ValueError(f"EMBEDDING() returned no vector for config '{cfg}'")
+    return str(row["v"])
+
+
+# Typed result rows: serialized directly by dump_json without an
+# intermediate dict copy per row.
+
+class DocSnippet(msgspec.Struct):
+    chunk_id: Optional[int]
+    doc_id: Optional[str]
+    title: Optional[str]
+    snippet: str
+    score: Optional[float]
+
+
+class ProductHit(msgspec.Struct):
+    ProductID: Optional[int]
+    Name: Optional[str]
+    Category: Optional[str]
+    Price: Any
+    score: Optional[float]
 
 
 # ----------------------------- Base class -----------------------------
 
 class _BaseRAGSQLTool(Tool):
     """
-    Base class that manages/reuses a single IRISClient connection.
-    Computes query embeddings inside IRIS using EMBEDDING(text, '<config>').
+    Base class over the shared IRIS connection pool.
+    Query embeddings are computed once per (config, query) via EMBEDDING()
+    inside IRIS, then served from an LRU cache and bound with TO_VECTOR(?).
     """
 
     def __init__(self, db: Optional[IRISClient] = None, embedding_config_env: str = "EMBEDDING_CONFIG_NAME") -> None:
@@ -25,27 +77,32 @@ class _BaseRAGSQLTool(Tool):
         self._db = db
         self._embed_config = os.getenv(embedding_config_env, "my-openai-config")
 
-    def setup(self) -> None:
-        if self._db is None:
-            self._db = IRISClient()
+    @contextmanager
+    def _connection(self) -> Iterator[IRISClient]:
+        """Yield the injected client, or one checked out of the shared pool."""
+        if self._db is not None:
+            yield self._db
+            return
+        client = get_pool().acquire()
+        try:
+            yield client
+        finally:
+            get_pool().release(client)
 
-    def _ensure_connected(self) -> None:
-        assert self._db is not None
+    # No eager healthcheck: queries run straight away and reconnect+retry
+    # once if the connection turns out to be dead.
+    @staticmethod
+    def _query(db: IRISClient, sql: str, params: Optional[List[Any]] = None):
         try:
-            self._db.query_one("SELECT 1 AS one")
+            return db.query(sql, params)
         except Exception:
-            self._db = IRISClient()
+            db.reconnect()
+            return db.query(sql, params)
 
-    @staticmethod
-    def _validate_config_name(name: str) -> str:
-        """
-        For safety, only allow [A-Za-z0-9._-] in the config name we inline in SQL.
-        """
-        if not re.fullmatch(r"[A-Za-z0-9._-]+", name or ""):
-            raise ValueError(
-                "Invalid EMBEDDING config name. Allowed: letters, digits, dot, underscore, dash."
-            )
-        return name
+    def _query_embedding(self, query: str) -> str:
+        """Return the (cached) embedding vector for a normalized query."""
+        cfg = validate_config_name(self._embed_config)
+        return _embed_query(cfg, query.strip().lower())
 
 
 # --------------------------- Doc search tool ---------------------------
@@ -54,7 +111,7 @@ class RAGDocSearchTool(_BaseRAGSQLTool):
     """
     Semantic search over knowledge base documents:
 
-    • Scores each DocVectors.Embedding against EMBEDDING(:query, '<config>') inside IRIS
+    • Scores each DocChunks.Embedding against the cached query embedding in IRIS
     • Returns top-k snippets (ChunkId, DocID, Title, Body snippet, score)
     """
 
@@ -69,43 +126,70 @@ class RAGDocSearchTool(_BaseRAGSQLTool):
     }
     output_type = "string"
 
-    def forward(self, query: str, k: int = 3) -> str:
-        self.setup()
-        self._ensure_connected()
-        assert self._db is not None
-
-        q = (query or "").strip()
-        if not q:
-            return json.dumps({"snippets": [], "note": "empty query"}, **_JSON)
-
-        top_k = max(1, min(int(k), 10))
-        cfg = self._validate_config_name(self._embed_config)
-
-        sql = f"""
-        SELECT TOP {top_k}
-            c.ChunkID            AS chunk_id,
-            c.DocID              AS doc_id,
-            c.Title              AS title,
-            SUBSTRING(c.ChunkText, 1, 400) AS snippet,
-            VECTOR_DOT_PRODUCT(c.Embedding, EMBEDDING(?, '{cfg}')) AS score
+    _MAX_K = 10
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # One stable SQL string per k: no per-call f-string work, and IRIS
+        # sees the same statement text every time (statement-cache friendly).
+        # ORDER BY keeps the literal VECTOR_DOT_PRODUCT(col, TO_VECTOR(?))
+        # form the HNSW planner pattern-matches — a derived-table join is
+        # not recognized and falls back to a full scan. The vector is bound
+        # twice (select + order by); bound parameters are evaluated once
+        # per statement, not per row.
+        # Phase 1 ranks ids only (no text materialization for losers) ...
+        self._rank_sql_by_k = {
+            k: f"""
+        SELECT TOP {k}
+            c.ChunkID AS chunk_id,
+            VECTOR_DOT_PRODUCT(c.Embedding, TO_VECTOR(?, FLOAT)) AS score
         FROM Agent_Data.DocChunks c
-        ORDER BY score DESC
+        ORDER BY VECTOR_DOT_PRODUCT(c.Embedding, TO_VECTOR(?, FLOAT)) DESC
+        """
+            for k in range(1, self._MAX_K + 1)
+        }
+        # ... phase 2 fetches the snippet for just the k winners.
+        self._fetch_sql_by_n = {
+            n: f"""
+        SELECT
+            ChunkID AS chunk_id,
+            DocID   AS doc_id,
+            Title   AS title,
+            SUBSTRING(ChunkText, 1, 400) AS snippet
+        FROM Agent_Data.DocChunks
+        WHERE ChunkID IN ({", ".join("?" * n)})
         """
-        rows = self._db.query(sql, [q])
-
-        payload = {
-            "snippets": [
-                {
-                    "chunk_id": r.get("chunk_id"),
-                    "doc_id": r.get("doc_id"),
-                    "title": r.get("title"),
-                    "snippet": (r.get("snippet") or "").strip(),
-                    "score": float(r["score"]) if r.get("score") is not None else None,
-                }
-                for r in rows
-            ]
+            for n in range(1, self._MAX_K + 1)
         }
-        return json.dumps(payload, **_JSON)
+
+    def forward(self, query: str, k: Optional[int] = 3) -> str:
+        q = (query or "").strip()
+        if not q:
+            return dump_json({"snippets": [], "note": "empty query"})
+
+        # Models routinely pass None for advertised-nullable params.
+        top_k = 3 if k is None else max(1, min(int(k), self._MAX_K))
+        qvec = self._query_embedding(q)
+
+        with self._connection() as db:
+            ranked = self._query(db, self._rank_sql_by_k[top_k], [qvec, qvec])
+            if not ranked:
+                return dump_json({"snippets": []})
+            ids = [r.chunk_id for r in ranked]
+            details = self._query(db, self._fetch_sql_by_n[len(ids)], ids)
+
+        by_id = {d.chunk_id: d for d in details}
+        snippets = [
+            DocSnippet(
+                chunk_id=r.chunk_id,
+                doc_id=getattr(by_id.get(r.chunk_id), "doc_id", None),
+                title=getattr(by_id.get(r.chunk_id), "title", None),
+                snippet=(getattr(by_id.get(r.chunk_id), "snippet", None) or "").strip(),
+                score=float(r.score) if r.score is not None else None,
+            )
+            for r in ranked
+        ]
+        return dump_json({"snippets": snippets})
 
 
 # ------------------------- Product search tool -------------------------
@@ -114,7 +198,7 @@ class RAGProductSearchTool(_BaseRAGSQLTool):
     """
     Semantic search over products:
 
-    • Scores each ProductVectors.Embedding against EMBEDDING(:query, '<config>') in IRIS
+    • Scores each Products.Embedding against the cached query embedding in IRIS
     • Optional filters: price_max (<=)
     • Returns top-k products with similarity score
     """
@@ -130,57 +214,68 @@ class RAGProductSearchTool(_BaseRAGSQLTool):
     }
     output_type = "string"
 
+    _MAX_K = 20
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Templates keyed by (k, price filter on/off): stable statement text
+        # per shape, so neither Python nor IRIS re-parses on every call.
+        # As in the doc tool, ORDER BY keeps the direct VECTOR_DOT_PRODUCT
+        # form the HNSW planner recognizes (vector bound twice, evaluated
+        # once per statement).
+        self._sql_by_k = {
+            (k, filtered): f"""
+        SELECT TOP {k}
+            p.ProductID,
+            p.Name,
+            p.Category,
+            p.Price,
+            VECTOR_DOT_PRODUCT(p.Embedding, TO_VECTOR(?, FLOAT)) score
+        FROM Agent_Data.Products p
+        {"WHERE p.Price <= ?" if filtered else ""}
+        ORDER BY VECTOR_DOT_PRODUCT(p.Embedding, TO_VECTOR(?, FLOAT)) DESC
+        """
+            for k in range(1, self._MAX_K + 1)
+            for filtered in (False, True)
+        }
+
     def forward(
         self,
         query: str,
-        k: int = 5,
+        k: Optional[int] = 5,
         price_max: Optional[float] = None,
     ) -> str:
-        self.setup()
-        self._ensure_connected()
-        assert self._db is not None
-
         q = (query or "").strip()
         if not q:
-            return json.dumps({"products": [], "note": "empty query"}, **_JSON)
+            return dump_json({"products": [], "note": "empty query"})
 
-        top_k = max(1, min(int(k), 20))
-        cfg = self._validate_config_name(self._embed_config)
+        # Models routinely pass None for advertised-nullable params.
+        top_k = 5 if k is None else max(1, min(int(k), self._MAX_K))
+        qvec = self._query_embedding(q)
 
-        # Build WHERE for optional filters (all bound as parameters)
-        where = []
-        params: List[Any] = [q]  # first param is the text for EMBEDDING(?, cfg)
-        if price_max is not None and price_max >= 0:
-            where.append("p.Price <= ?")
+        # Optional filters are always bound as parameters; placeholder order
+        # is select-vector, [price], order-by-vector.
+        filtered = price_max is not None and price_max >= 0
+        params: List[Any] = [qvec]
+        if filtered:
             params.append(price_max)
-        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
-
-        sql = f"""
-        SELECT TOP {top_k}
-            p.ProductID,
-            p.Name,
-            p.Category,
-            p.Price,
-            VECTOR_DOT_PRODUCT(p.Embedding, EMBEDDING(?, '{cfg}')) score
-        FROM Agent_Data.Products p
-        {where_sql}
-        ORDER BY score DESC
-        """
-        rows = self._db.query(sql, params)
-
-        payload = {
-            "products": [
-                {
-                    "ProductID": r.get("ProductID"),
-                    "Name": r.get("Name"),
-                    "Category": r.get("Category"),
-                    "Price": r.get("Price"),
-                    "score": float(r["score"]) if r.get("score") is not None else None,
-                }
-                for r in rows
-            ]
-        }
-        return json.dumps(payload, **_JSON)
+        params.append(qvec)
+
+        sql = self._sql_by_k[(top_k, filtered)]
+        with self._connection() as db:
+            rows = self._query(db, sql, params)
+
+        products = [
+            ProductHit(
+                ProductID=getattr(r, "ProductID", None),
+                Name=getattr(r, "Name", None),
+                Category=getattr(r, "Category", None),
+                Price=getattr(r, "Price", None),
+                score=float(r.score) if getattr(r, "score", None) is not None else None,
+            )
+            for r in rows
+        ]
+        return dump_json({"products": products})
 
 
 __all__ = [
@@ -1,15 +1,16 @@
 # agent/tools/shipping_tool.py
 from __future__ import annotations
 
-import json
 import os
 import uuid
 from typing import Any, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from smolagents import Tool
 
-_JSON = dict(indent=4, sort_keys=True, default=str)
+from agent.tools._json import dump_json
 
 
 class ShippingStatusTool(Tool):
@@ -47,6 +48,16 @@ class ShippingStatusTool(Tool):
             "IRIS_SHIPPING_STATUS_URL",
             "http://localhost:52773/api/shipping/status",
         )
+        # Pooled session with keep-alive: only the first call pays TCP/TLS setup.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=10,
+            max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504]),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._static_headers = {"Content-Type": "application/json"}
 
     def forward(
         self,
@@ -62,13 +73,10 @@ class ShippingStatusTool(Tool):
             "orderStatus": order_status,
             "trackingNumber": tracking_number,
         }
-        headers = {
-            "Content-Type": "application/json",
-            "X-Request-Id": rid,
-        }
+        headers = {**self._static_headers, "X-Request-Id": rid}
 
         try:
-            resp = requests.post(endpoint, json=payload, headers=headers, timeout=timeout_sec)
+            resp = self._session.post(endpoint, json=payload, headers=headers, timeout=timeout_sec)
             content_type = resp.headers.get("content-type", "")
             # Try to return server JSON if possible; otherwise wrap text
             if "application/json" in content_type.lower():
@@ -83,13 +91,12 @@ class ShippingStatusTool(Tool):
                 "httpStatus": resp.status_code,
                 "response": data,
             }
-            return json.dumps(wrapped, **_JSON)
+            return dump_json(wrapped)
         except Exception as e:
-            return json.dumps(
+            return dump_json(
                 {
                     "endpoint": endpoint,
                     "requestId": rid,
                     "error": f"{type(e).__name__}: {e}",
-                },
-                **_JSON,
+                }
             )
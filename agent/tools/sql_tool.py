@@ -1,41 +1,87 @@
 # runtime/src/agent/tools/sql_tool.py
 from __future__ import annotations
 
-import json
-from typing import Any, Dict, Optional, List
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, List
 
+import msgspec
 from smolagents import Tool
 from db.iris_client import IRISClient
+from db.pool import get_pool
+from agent.tools._json import dump_json
 
-_JSON_KW = dict(indent=4, sort_keys=True, default=str)
+
+class OrderRow(msgspec.Struct):
+    """Typed order result row; serialized directly by dump_json."""
+
+    OrderID: int
+    OrderDate: Any
+    Status: Optional[str]
+    ProductID: int
+    ProductName: Optional[str]
+    Category: Optional[str]
+    Price: Any
+    TrackingCode: Optional[str]
+
+
+def _order_row(r: Any) -> OrderRow:
+    return OrderRow(
+        OrderID=r.OrderID,
+        OrderDate=r.OrderDate,
+        Status=r.Status,
+        ProductID=r.ProductID,
+        ProductName=r.ProductName,
+        Category=r.Category,
+        Price=r.Price,
+        TrackingCode=r.TrackingCode,
+    )
 
 
 class _BaseSQLTool(Tool):
     """
-    Base class that manages/reuses a single IRISClient connection.
-    Pass a shared IRISClient(db) if you want multiple tools to reuse it.
+    Base class over the shared IRIS connection pool.
+    Pass a dedicated IRISClient(db) to pin a tool to one connection instead.
     """
 
     def __init__(self, db: Optional[IRISClient] = None) -> None:
         super().__init__()
         self._db = db
 
-    def setup(self) -> None:
-        """Lazy init if no client was injected."""
-        if self._db is None:
-            self._db = IRISClient()
+    @contextmanager
+    def _connection(self) -> Iterator[IRISClient]:
+        """Yield the injected client, or one checked out of the shared pool."""
+        if self._db is not None:
+            yield self._db
+            return
+        client = get_pool().acquire()
+        try:
+            yield client
+        finally:
+            get_pool().release(client)
+
+    # No eager healthcheck: queries run straight away and reconnect+retry
+    # once if the connection turns out to be dead.
+    @staticmethod
+    def _query(db: IRISClient, sql: str, params: Optional[List[Any]] = None):
+        try:
+            return db.query(sql, params)
+        except Exception:
+            db.reconnect()
+            return db.query(sql, params)
 
-    def _ensure_connected(self) -> None:
-        """Lightweight healthcheck; reconnect if needed."""
-        assert self._db is not None
+    @staticmethod
+    def _query_one(db: IRISClient, sql: str, params: Optional[List[Any]] = None):
         try:
-            self._db.query_one("SELECT 1 AS one")
+            return db.query_one(sql, params)
         except Exception:
-            self._db = IRISClient()
+            db.reconnect()
+            return db.query_one(sql, params)
 
-    # Helper shared across tools
-    def _get_customer_id(self, email: str) -> Optional[int]:
-        row = self._db.query_one(  # type: ignore[union-attr]
+    # Fallback helper: only used to tell "unknown user" apart from "no orders"
+    # when the main (single round-trip) JOIN query returns nothing.
+    def _get_customer_id(self, db: IRISClient, email: str) -> Optional[int]:
+        row = self._query_one(
+            db,
             "SELECT CustomerID FROM Agent_Data.Customers WHERE Email = ?",
             [email],
         )
@@ -63,16 +109,7 @@ class SQLLastOrdersTool(_BaseSQLTool):
     }
     output_type = "string"
 
-    def forward(self, user_email: str, limit: int = 30) -> str:
-        self.setup()
-        self._ensure_connected()
-        assert self._db is not None
-
-        cid = self._get_customer_id(user_email)
-        if cid is None:
-            return json.dumps({"orders": [], "note": "unknown user_email"}, **_JSON_KW)
-
-        sql = f"""
+    _SQL_TMPL = """
         SELECT
             o.OrderID,
             o.OrderDate,
@@ -82,15 +119,32 @@ class SQLLastOrdersTool(_BaseSQLTool):
             p.Category AS Category,
             p.Price    AS Price,
             s.TrackingCode
-        FROM Agent_Data.Orders AS o
+        FROM Agent_Data.Customers AS cu
+        JOIN Agent_Data.Orders    AS o ON o.CustomerID = cu.CustomerID
         JOIN Agent_Data.Products  AS p ON p.ProductID = o.ProductID
         LEFT JOIN Agent_Data.Shipments AS s ON s.OrderID = o.OrderID
-        WHERE o.CustomerID = ?
+        WHERE cu.Email = ?
         ORDER BY o.OrderDate DESC
-        LIMIT {int(max(1, limit))}
+        LIMIT {limit}
         """
-        rows = self._db.query(sql, [cid])
-        return json.dumps({"orders": rows}, **_JSON_KW)
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Prebuild the common limits; rarer values are cached on first use.
+        # Stable statement text keeps IRIS's statement cache warm.
+        self._sql_by_limit = {n: self._SQL_TMPL.format(limit=n) for n in (3, 10, 30)}
+
+    def forward(self, user_email: str, limit: Optional[int] = 30) -> str:
+        # Models routinely pass None for advertised-nullable params.
+        n = 30 if limit is None else int(max(1, limit))
+        sql = self._sql_by_limit.get(n)
+        if sql is None:
+            sql = self._sql_by_limit.setdefault(n, self._SQL_TMPL.format(limit=n))
+        with self._connection() as db:
+            rows = self._query(db, sql, [user_email])
+            if not rows and self._get_customer_id(db, user_email) is None:
+                return dump_json({"orders": [], "note": "unknown user_email"})
+        return dump_json({"orders": [_order_row(r) for r in rows]})
 
 
 class SQLOrderByIdTool(_BaseSQLTool):
@@ -114,14 +168,6 @@ class SQLOrderByIdTool(_BaseSQLTool):
     output_type = "string"
 
     def forward(self, user_email: str, order_id: int) -> str:
-        self.setup()
-        self._ensure_connected()
-        assert self._db is not None
-
-        cid = self._get_customer_id(user_email)
-        if cid is None:
-            return json.dumps({"order": None, "note": "unknown user_email"}, **_JSON_KW)
-
         sql = """
         SELECT
             o.OrderID,
@@ -132,15 +178,19 @@ class SQLOrderByIdTool(_BaseSQLTool):
             p.Category AS Category,
             p.Price    AS Price,
             s.TrackingCode
-        FROM Agent_Data.Orders AS o
+        FROM Agent_Data.Customers AS cu
+        JOIN Agent_Data.Orders    AS o ON o.CustomerID = cu.CustomerID
         JOIN Agent_Data.Products  AS p ON p.ProductID = o.ProductID
         LEFT JOIN Agent_Data.Shipments AS s ON s.OrderID = o.OrderID
-        WHERE o.CustomerID = ? AND o.OrderID = ?
+        WHERE cu.Email = ? AND o.OrderID = ?
         """
-        row = self._db.query_one(sql, [cid, int(order_id)])
-        if not row:
-            return json.dumps({"order": None, "note": "order not found or not owned by this user"}, **_JSON_KW)
-        return json.dumps({"order": row}, **_JSON_KW)
+        with self._connection() as db:
+            row = self._query_one(db, sql, [user_email, int(order_id)])
+            if not row:
+                if self._get_customer_id(db, user_email) is None:
+                    return dump_json({"order": None, "note": "unknown user_email"})
+                return dump_json({"order": None, "note": "order not found or not owned by this user"})
+        return dump_json({"order": row})
 
 
 class SQLOrdersInRangeTool(_BaseSQLTool):
@@ -168,14 +218,6 @@ class SQLOrdersInRangeTool(_BaseSQLTool):
     output_type = "string"
 
     def forward(self, user_email: str, start_date: str, end_date: str) -> str:
-        self.setup()
-        self._ensure_connected()
-        assert self._db is not None
-
-        cid = self._get_customer_id(user_email)
-        if cid is None:
-            return json.dumps({"orders": [], "note": "unknown user_email"}, **_JSON_KW)
-
         sql = """
         SELECT
             o.OrderID,
@@ -186,15 +228,113 @@ class SQLOrdersInRangeTool(_BaseSQLTool):
             p.Category AS Category,
             p.Price    AS Price,
             s.TrackingCode
-        FROM Agent_Data.Orders AS o
+        FROM Agent_Data.Customers AS cu
+        JOIN Agent_Data.Orders    AS o ON o.CustomerID = cu.CustomerID
         JOIN Agent_Data.Products  AS p ON p.ProductID = o.ProductID
         LEFT JOIN Agent_Data.Shipments AS s ON s.OrderID = o.OrderID
-        WHERE o.CustomerID = ?
+        WHERE cu.Email = ?
           AND o.OrderDate BETWEEN TO_DATE(?, 'YYYY-MM-DD') AND TO_DATE(?, 'YYYY-MM-DD')
         ORDER BY o.OrderDate DESC
         """
-        rows = self._db.query(sql, [cid, start_date, end_date])
-        return json.dumps({"orders": rows}, **_JSON_KW)
+        with self._connection() as db:
+            rows = self._query(db, sql, [user_email, start_date, end_date])
+            if not rows and self._get_customer_id(db, user_email) is None:
+                return dump_json({"orders": [], "note": "unknown user_email"})
+        return dump_json({"orders": [_order_row(r) for r in rows]})
+
+
+class SQLOrdersTool(_BaseSQLTool):
+    """
+    Unified order lookup for a user (by email): most recent orders first,
+    optionally narrowed to a single OrderID and/or an inclusive date range.
+    One tool instead of three means one prepared statement, one tool
+    description in the LLM prompt, and one ReAct decision per order query;
+    optional predicates collapse server-side when their parameter is NULL.
+    """
+
+    name = "sql_orders"
+    description = (
+        "Return orders for a user (by email), most recent first. "
+        "Optionally filter to a single order_id and/or the inclusive date range "
+        "[start_date, end_date] (YYYY-MM-DD)."
+    )
+    inputs: Dict[str, Dict[str, Any]] = {
+        "user_email": {
+            "type": "string",
+            "description": "Customer email (required)."
+        },
+        "order_id": {
+            "type": "integer",
+            "description": "Optional OrderID to look up a single order.",
+            "nullable": True
+        },
+        "start_date": {
+            "type": "string",
+            "description": "Optional start date in 'YYYY-MM-DD'.",
+            "nullable": True
+        },
+        "end_date": {
+            "type": "string",
+            "description": "Optional end date in 'YYYY-MM-DD'.",
+            "nullable": True
+        },
+        "limit": {
+            "type": "integer",
+            "description": "Max rows to return (default 30).",
+            "nullable": True
+        },
+    }
+    output_type = "string"
+
+    _SQL_TMPL = """
+        SELECT
+            o.OrderID,
+            o.OrderDate,
+            o.Status,
+            p.ProductID,
+            p.Name     AS ProductName,
+            p.Category AS Category,
+            p.Price    AS Price,
+            s.TrackingCode
+        FROM Agent_Data.Customers AS cu
+        JOIN Agent_Data.Orders    AS o ON o.CustomerID = cu.CustomerID
+        JOIN Agent_Data.Products  AS p ON p.ProductID = o.ProductID
+        LEFT JOIN Agent_Data.Shipments AS s ON s.OrderID = o.OrderID
+        WHERE cu.Email = ?
+          AND (? IS NULL OR o.OrderID = ?)
+          AND (? IS NULL OR o.OrderDate >= TO_DATE(?, 'YYYY-MM-DD'))
+          AND (? IS NULL OR o.OrderDate <= TO_DATE(?, 'YYYY-MM-DD'))
+        ORDER BY o.OrderDate DESC
+        LIMIT {limit}
+        """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._sql_by_limit = {n: self._SQL_TMPL.format(limit=n) for n in (1, 3, 10, 30)}
+
+    def forward(
+        self,
+        user_email: str,
+        order_id: Optional[int] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        limit: Optional[int] = 30,
+    ) -> str:
+        # Models routinely pass None for advertised-nullable params.
+        n = 30 if limit is None else int(max(1, limit))
+        sql = self._sql_by_limit.get(n)
+        if sql is None:
+            sql = self._sql_by_limit.setdefault(n, self._SQL_TMPL.format(limit=n))
+
+        oid = int(order_id) if order_id is not None else None
+        params = [user_email, oid, oid, start_date, start_date, end_date, end_date]
+        with self._connection() as db:
+            rows = self._query(db, sql, params)
+            if not rows and self._get_customer_id(db, user_email) is None:
+                return dump_json({"orders": [], "note": "unknown user_email"})
+        if not rows and oid is not None:
+            return dump_json({"orders": [], "note": "order not found or not owned by this user"})
+        return dump_json({"orders": [_order_row(r) for r in rows]})
 
 
-__all__ = ["SQLLastOrdersTool", "SQLOrderByIdTool", "SQLOrdersInRangeTool"]
+__all__ = ["SQLOrdersTool", "SQLLastOrdersTool", "SQLOrderByIdTool", "SQLOrdersInRangeTool"]
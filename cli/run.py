@@ -8,7 +8,7 @@ import sys
 from dotenv import load_dotenv
 load_dotenv()
 
-from agent.customer_support_agent import CustomerSupportAgent
+from agent.customer_support_agent import get_agent
 
 
 def main() -> int:
@@ -31,7 +31,7 @@ def main() -> int:
         print("ERROR: OPENAI_API_KEY is not set in your environment.", file=sys.stderr)
         return 1
 
-    agent = CustomerSupportAgent()
+    agent = get_agent()
 
     # One-shot mode
     if args.message:
@@ -1,9 +1,11 @@
 # runtime/src/db/iris_client.py
 from __future__ import annotations
 
-from typing import Any, Iterable, List, Dict, Tuple, Optional
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, List, Dict, Tuple, Optional
 
-import os 
+import os
 
 # InterSystems IRIS Python DB-API (PEP 249)
 # Docs: https://docs.intersystems.com/iris20252/csp/docbook/DocBook.UI.Page.cls?KEY=BPYNAT_pyapi
@@ -37,8 +39,13 @@ class IRISClient:
         password: str = _PASSWORD,
         autocommit: bool = True,
     ) -> None:
+        self._connect_args = (host, port, namespace, username, password)
+        self._autocommit = autocommit
         self._conn = iris.connect(host, port, namespace, username, password)
         self._conn.autocommit = autocommit
+        # Cursors cached per SQL text: reusing a cursor lets IRIS keep the
+        # prepared statement, skipping re-parse/re-plan on every call.
+        self._stmt_cache: Dict[str, Any] = {}
 
     # --- Context manager support ---
     def __enter__(self) -> "IRISClient":
@@ -47,45 +54,106 @@ class IRISClient:
     def __exit__(self, exc_type, exc, tb) -> None:
         self.close()
 
+    # --- Internal helpers ---
+    def _cursor_for(self, sql: str):
+        """Return a cached cursor for this SQL text (created on first use)."""
+        cur = self._stmt_cache.get(sql)
+        if cur is None:
+            cur = self._conn.cursor()
+            self._stmt_cache[sql] = cur
+        return cur
+
     # --- Public API ---
-    def query(self, sql: str, params: Optional[Iterable[Any]] = None) -> List[Dict[str, Any]]:
+    def query(self, sql: str, params: Optional[Iterable[Any]] = None) -> List[Tuple[Any, ...]]:
         """
-        Run a SELECT and return rows as a list of dicts.
+        Run a SELECT and return rows as lightweight namedtuples.
         Use '?' placeholders in SQL and pass params as a sequence.
+
+        Fields are addressable by column name (row.OrderID) or position;
+        call row._asdict() when a real dict is needed (e.g. for JSON output).
+        Avoids building a dict per row, which dominated CPU on wide results.
         """
-        cur = self._conn.cursor()
-        try:
-            cur.execute(sql, tuple(params or ()))
-            cols = [c[0] for c in (cur.description or [])]
-            return [dict(zip(cols, row)) for row in cur.fetchall()]
-        finally:
-            cur.close()
+        return list(self.iter_query(sql, params))
+
+    def iter_query(
+        self, sql: str, params: Optional[Iterable[Any]] = None, chunksize: int = 500
+    ) -> Iterator[Tuple[Any, ...]]:
+        """
+        Run a SELECT and yield rows lazily, fetching `chunksize` rows per
+        round-trip via fetchmany(). Peak memory is O(chunksize) instead of
+        O(result set); exhaust the iterator before reusing the same SQL on
+        this client (the prepared cursor is shared per statement).
+        """
+        cur = self._cursor_for(sql)
+        cur.arraysize = chunksize
+        cur.execute(sql, tuple(params or ()))
+        cols = [c[0] for c in (cur.description or [])]
+        Row = namedtuple("Row", cols, rename=True)
+        while True:
+            batch = cur.fetchmany(chunksize)
+            if not batch:
+                break
+            for row in batch:
+                yield Row(*row)
 
     def query_one(self, sql: str, params: Optional[Iterable[Any]] = None) -> Optional[Dict[str, Any]]:
         """
         Run a SELECT and return a single row as dict (or None).
         """
-        cur = self._conn.cursor()
-        try:
-            cur.execute(sql, tuple(params or ()))
-            cols = [c[0] for c in (cur.description or [])]
-            row = cur.fetchone()
-            return dict(zip(cols, row)) if row else None
-        finally:
-            cur.close()
+        cur = self._cursor_for(sql)
+        cur.execute(sql, tuple(params or ()))
+        cols = [c[0] for c in (cur.description or [])]
+        row = cur.fetchone()
+        return dict(zip(cols, row)) if row else None
 
     def execute(self, sql: str, params: Optional[Iterable[Any]] = None) -> int:
         """
         Run INSERT/UPDATE/DELETE. Returns rowcount.
         """
-        cur = self._conn.cursor()
+        cur = self._cursor_for(sql)
+        cur.execute(sql, tuple(params or ()))
+        return cur.rowcount if cur.rowcount is not None else 0
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Iterable[Any]]) -> int:
+        """
+        Run one INSERT/UPDATE/DELETE for each parameter tuple in a single
+        round-trip (one parse on the server instead of one per row).
+        """
+        cur = self._cursor_for(sql)
+        cur.executemany(sql, [tuple(p) for p in seq_of_params])
+        return cur.rowcount if cur.rowcount is not None else 0
+
+    @contextmanager
+    def transaction(self) -> Iterator["IRISClient"]:
+        """
+        Group several statements into one transaction: one commit (and one
+        server fsync) at the end instead of one per statement. Rolls back on
+        error and restores the previous autocommit mode either way.
+        """
+        prev = self._conn.autocommit
+        self._conn.autocommit = False
         try:
-            cur.execute(sql, tuple(params or ()))
-            return cur.rowcount if cur.rowcount is not None else 0
+            yield self
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
         finally:
-            cur.close()
+            self._conn.autocommit = prev
+
+    def reconnect(self) -> None:
+        """Close and re-open the underlying connection (e.g. after a network drop)."""
+        self.close()
+        self._conn = iris.connect(*self._connect_args)
+        self._conn.autocommit = self._autocommit
 
     def close(self) -> None:
+        for cur in self._stmt_cache.values():
+            try:
+                cur.close()
+            except Exception:
+                pass
+        self._stmt_cache.clear()
         try:
             self._conn.close()
         except Exception:
@@ -0,0 +1,58 @@
+# db/pool.py
+from __future__ import annotations
+
+import os
+import queue
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from db.iris_client import IRISClient
+
+_POOL_SIZE = int(os.getenv("IRIS_POOL_SIZE", "4"))
+
+
+class IRISPool:
+    """
+    Small LIFO pool of IRISClient connections shared by all tools.
+
+    LIFO keeps the most recently used (warmest) connection on top of the
+    stack. acquire() hands out an idle connection or opens a new one when
+    the pool is empty; release() returns it, closing instead when the pool
+    is already full.
+    """
+
+    def __init__(self, maxsize: int = _POOL_SIZE) -> None:
+        self._idle: "queue.LifoQueue[IRISClient]" = queue.LifoQueue(maxsize)
+
+    def acquire(self) -> IRISClient:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return IRISClient()
+
+    def release(self, client: Optional[IRISClient]) -> None:
+        if client is None:
+            return
+        try:
+            self._idle.put_nowait(client)
+        except queue.Full:
+            client.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[IRISClient]:
+        client = self.acquire()
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+
+_POOL = IRISPool()
+
+
+def get_pool() -> IRISPool:
+    """Return the process-wide connection pool."""
+    return _POOL
+
+
+__all__ = ["IRISPool", "get_pool"]
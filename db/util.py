@@ -0,0 +1,22 @@
+# db/util.py
+from __future__ import annotations
+
+import re
+
+# Compiled once at import: config names are checked on every embedding call.
+_CONFIG_RE = re.compile(r"[A-Za-z0-9._-]+")
+
+
+def validate_config_name(name: str) -> str:
+    """
+    For safety, only allow [A-Za-z0-9._-] in EMBEDDING config names that get
+    inlined in SQL text.
+    """
+    if not _CONFIG_RE.fullmatch(name or ""):
+        raise ValueError(
+            "Invalid EMBEDDING config name. Allowed: letters, digits, dot, underscore, dash."
+        )
+    return name
+
+
+__all__ = ["validate_config_name"]
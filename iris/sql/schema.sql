@@ -26,7 +26,8 @@ CREATE TABLE Agent_Data.Products (
     Price DECIMAL(10,2),
     WarrantyMonths INT,
     Description VARCHAR(1000),
-    Embedding VECTOR(FLOAT, 1536)     -- vector for product search
+    ContentHash CHAR(64),             -- sha256 of Name+Description the Embedding was built from
+    Embedding VECTOR(FLOAT, 1536)     -- vector for product search (FLOAT: half the bytes/row of DOUBLE)
 );
 
 ------------------------------------------------------------
@@ -64,8 +65,74 @@ CREATE TABLE Agent_Data.DocChunks (
     EndPos      INT,                        -- optional: char offset
     Title       VARCHAR(200),
     Heading     VARCHAR(200),
-    ChunkText   VARCHAR(4000)   NOT NULL,  
-    Embedding   VECTOR(FLOAT, 1536),        -- vector for semantic search
+    ChunkText   VARCHAR(4000)   NOT NULL,
+    ContentHash  CHAR(64),                  -- sha256 of ChunkText, set at upsert
+    EmbeddedHash CHAR(64),                  -- ContentHash at the time Embedding was built
+    Embedding   VECTOR(FLOAT, 1536),        -- vector for semantic search (FLOAT: half the bytes/row of DOUBLE)
     CONSTRAINT DocChunksPK PRIMARY KEY (ChunkID),
     CONSTRAINT DocChunksDocIndexUQ UNIQUE (DocID, ChunkIndex)
-);
\ No newline at end of file
+);
+------------------------------------------------------------
+-- Approximate nearest-neighbor (HNSW) indexes for vector search
+-- Turns the top-k scans in the RAG tools from O(N) brute force
+-- into O(log N) graph traversals. Verify with EXPLAIN that the
+-- index is chosen for ORDER BY VECTOR_DOT_PRODUCT(...) DESC.
+------------------------------------------------------------
+CREATE INDEX HNSWDocChunks ON TABLE Agent_Data.DocChunks (Embedding)
+    AS HNSW(M=16, efConstruction=200, Distance='DotProduct');
+
+CREATE INDEX HNSWProducts ON TABLE Agent_Data.Products (Embedding)
+    AS HNSW(M=16, efConstruction=200, Distance='DotProduct');
+
+------------------------------------------------------------
+-- Server-side chunk upsert: the ingest script sends each doc
+-- body once and the chunk rows are produced inside IRIS — one
+-- round-trip per document instead of one parameter set per
+-- chunk. Chunking math and ContentHash (sha256 hex of the
+-- UTF-8 chunk text) mirror scripts/embed_sql.py::make_chunks,
+-- so the vector rebuild's hash-skip keeps working either way.
+------------------------------------------------------------
+CREATE PROCEDURE Agent_Data.SP_UpsertDocChunks(
+    IN pDocID VARCHAR(64),
+    IN pTitle VARCHAR(200),
+    IN pBody VARCHAR(32000),
+    IN pChunkSize INT,
+    IN pOverlap INT
+)
+LANGUAGE OBJECTSCRIPT
+{
+    new tLen, tStep, tStart, tEnd, tIdx, tChunk, tHash
+    set tLen = $LENGTH(pBody)
+    set:pTitle="" pTitle = pDocID
+    set tStart = 0, tIdx = 0
+    if tLen > 0 {
+        // Window math mirrors make_chunks exactly: one chunk when the body
+        // fits (or size is unset), else a window at every start < len, step
+        // = size - overlap. No early exit — the client path emits trailing
+        // windows past the first end-reaching one, and both paths must
+        // produce identical chunk sets for (DocID, ChunkIndex) upserts and
+        // the "[ok] upserted N chunks" count to stay truthful.
+        if (pChunkSize '> 0) || (tLen <= pChunkSize) {
+            set pChunkSize = tLen, tStep = tLen
+        } else {
+            set tStep = pChunkSize - pOverlap
+            set:tStep<1 tStep = 1
+        }
+        while tStart < tLen {
+            set tChunk = $EXTRACT(pBody, tStart + 1, tStart + pChunkSize)
+            set tEnd = tStart + $LENGTH(tChunk)
+            set tHash = $SYSTEM.Encryption.SHAHash(256, $ZCONVERT(tChunk, "O", "UTF8"))
+            set tHash = ##class(%xsd.hexBinary).LogicalToXSD(tHash)
+            set tHash = $ZCONVERT(tHash, "L")
+            // INSERT OR UPDATE on (DocID, ChunkIndex) leaves Embedding and
+            // EmbeddedHash of unchanged chunks alone, so the vector rebuild's
+            // ContentHash skip survives a re-ingest of an unchanged doc.
+            &sql(INSERT OR UPDATE Agent_Data.DocChunks
+                    (DocID, ChunkIndex, StartPos, EndPos, Title, Heading, ChunkText, ContentHash)
+                 VALUES (:pDocID, :tIdx, :tStart, :tEnd, :pTitle, NULL, :tChunk, :tHash))
+            set tStart = tStart + tStep, tIdx = tIdx + 1
+        }
+    }
+    // Drop only the stale tail (doc shrank, or emptied entirely).
+    &sql(DELETE FROM Agent_Data.DocChunks WHERE DocID = :pDocID AND ChunkIndex >= :tIdx)
+}
@@ -1,11 +1,14 @@
 # scripts/embed_sql.py
 from __future__ import annotations
 
+import hashlib
+import json
 import os
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,7 +17,9 @@ load_dotenv()
 if __name__ == "__main__" and __package__ is None:
     sys.path.insert(0, os.path.abspath("."))
 
+from agent import embed_cache
 from db.iris_client import IRISClient
+from db.util import validate_config_name
 
 
 # --------------------------- Config ---------------------------
@@ -30,101 +35,342 @@ SUPPORTED_EXTS = {".md", ".markdown", ".txt"}
 REFRESH_DOC_CHUNK_VECTORS = os.getenv("REFRESH_DOC_CHUNK_VECTORS", "1") == "1"
 REFRESH_PRODUCT_VECTORS   = os.getenv("REFRESH_PRODUCT_VECTORS", "1") == "1"
 
-def _validate_config_name(name: str) -> str:
-    if not re.fullmatch(r"[A-Za-z0-9._-]+", name or ""):
-        raise ValueError("Invalid EMBEDDING config name. Allowed: letters, digits, dot, underscore, dash.")
-    return name
-
+# Manifest of {path: [mtime_ns, size]} from the previous run; files whose
+# stat matches are not even read (their chunks are already upserted and the
+# ContentHash predicate keeps their vectors). Delete the file to force a
+# full re-read.
+MANIFEST_PATH = Path(os.getenv("EMBED_MANIFEST_PATH", ".embed_manifest.json"))
 
 # ------------------------- File loading ------------------------
 
-def _read_docs_from_fs(root: Path) -> List[Dict[str, str]]:
-    rows: List[Dict[str, str]] = []
-    if not root.exists():
-        print(f"[warn] docs dir not found: {root.resolve()}")
-        return rows
-
-    for path in root.rglob("*"):
-        if not path.is_file() or path.suffix.lower() not in SUPPORTED_EXTS:
-            continue
+def _load_manifest() -> Dict[str, List[int]]:
+    try:
+        return json.loads(MANIFEST_PATH.read_text())
+    except (OSError, ValueError):
+        return {}
 
-        doc_id = path.stem
-        text = path.read_text(encoding="utf-8", errors="ignore").strip()
 
-        # Title = first Markdown heading if present, else filename
+def _save_manifest(manifest: Dict[str, List[int]]) -> None:
+    try:
+        MANIFEST_PATH.write_text(json.dumps(manifest))
+    except OSError as e:
+        print(f"[warn] could not save manifest {MANIFEST_PATH}: {e}")
+
+# Leading Markdown heading: captures the heading text and the remaining body
+# in one pass (no splitlines / re-join of the whole document).
+_TITLE_RE = re.compile(r"\A(#+)[ \t]*([^\n]*)\n?(.*)", re.S)
+
+
+def _load_one(path: Path) -> Dict[str, str]:
+    """Read one doc file and extract DocID/Title/Body (runs on a worker thread)."""
+    doc_id = path.stem
+    # The body is truncated to DOC_BODY_MAX_CHARS anyway, so only read that
+    # prefix (4 bytes/char covers the UTF-8 worst case) instead of decoding
+    # whole large files. errors="ignore" also swallows a trailing split char.
+    with path.open("rb") as f:
+        raw = f.read(DOC_BODY_MAX_CHARS * 4)
+    text = raw.decode("utf-8", errors="ignore").strip()
+
+    # Title = leading Markdown heading if present (stripped from the body),
+    # else filename
+    m = _TITLE_RE.match(text)
+    if m:
+        title = m.group(2).strip() or path.stem
+        body = m.group(3).lstrip()
+    else:
         title = path.stem
-        for line in text.splitlines():
-            if line.strip().startswith("#"):
-                title = line.lstrip("#").strip() or title
-                break
-
         body = text
-        if body.startswith("#") and title in body[: len(title) + 4]:
-            body = "\n".join(body.splitlines()[1:]).lstrip()
-
-        if len(body) > DOC_BODY_MAX_CHARS:
-            body = body[: DOC_BODY_MAX_CHARS]
 
-        rows.append({"DocID": doc_id, "Title": title, "Body": body})
-    return rows
+    if len(body) > DOC_BODY_MAX_CHARS:
+        body = body[: DOC_BODY_MAX_CHARS]
+
+    return {"DocID": doc_id, "Title": title, "Body": body}
+
+
+def _iter_doc_entries(dirpath: str) -> Iterator[os.DirEntry]:
+    """Recursive scandir walk yielding supported doc files. Suffix filtering
+    happens on the entry name and dot-dirs are pruned before descent, so
+    non-matching trees cost one directory read instead of a stat per entry
+    (DirEntry.is_dir/is_file/stat reuse the data from the directory read)."""
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith("."):
+                    yield from _iter_doc_entries(entry.path)
+            elif (
+                entry.is_file(follow_symlinks=False)
+                and os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTS
+            ):
+                yield entry
+
+
+def _read_docs_from_fs(
+    root: Path, manifest: Optional[Dict[str, List[int]]] = None
+) -> Tuple[List[Dict[str, str]], Dict[str, List[int]]]:
+    """Return (docs for new/changed files, updated manifest). Files whose
+    (mtime_ns, size) match the previous run's manifest are skipped without
+    being opened."""
+    new_manifest: Dict[str, List[int]] = {}
+    if not root.exists():
+        print(f"[warn] docs dir not found: {root.resolve()}")
+        return [], new_manifest
+
+    manifest = manifest or {}
+    paths: List[Path] = []
+    skipped = 0
+    for entry in _iter_doc_entries(str(root)):
+        st = entry.stat()
+        stamp = [st.st_mtime_ns, st.st_size]
+        new_manifest[entry.path] = stamp
+        if manifest.get(entry.path) == stamp:
+            skipped += 1
+        else:
+            paths.append(Path(entry.path))
+    if skipped:
+        print(f"[info] {skipped} unchanged files skipped via manifest")
+    if not paths:
+        return [], new_manifest
+
+    # File loading is I/O bound: overlap the open/read/decode chains.
+    # No point spawning more threads than there are files to read.
+    with ThreadPoolExecutor(max_workers=min(32, len(paths))) as ex:
+        return list(ex.map(_load_one, paths)), new_manifest
 
 
 # --------------------------- Chunking --------------------------
 
-def make_chunks(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, int, str]]:
+def make_chunks(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[int, int, str]]:
+    """Yield (start, end, chunk) windows lazily: peak memory stays one chunk
+    regardless of document length (callers batch rows as they consume)."""
+    n = len(text)
     if size <= 0:
-        return [(0, len(text), text)]
+        # Unset/degenerate size: the whole text as one chunk (none if empty,
+        # matching SP_UpsertDocChunks which inserts nothing for empty bodies).
+        if n:
+            yield (0, n, text)
+        return
+    if n <= size:
+        # Fast path: the whole text fits in one chunk (empty text -> none).
+        if n:
+            yield (0, n, text)
+        return
+    step = max(1, size - max(0, overlap))
+    for i in range(0, n, step):
+        yield (i, min(i + size, n), text[i : i + size])
+
+
+def _chunk_count(n: int, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> int:
+    """Number of chunks make_chunks yields for an n-char text, without
+    materializing any slices."""
+    if n == 0:
+        return 0
+    if size <= 0 or n <= size:
+        return 1
     step = max(1, size - max(0, overlap))
-    out: List[Tuple[int, int, str]] = []
-    i = 0
-    while i < len(text):
-        chunk = text[i : i + size]
-        if not chunk:
-            break
-        out.append((i, i + len(chunk), chunk))
-        i += step
-    return out
+    return -(-n // step)
 
 
 # --------------------------- DB ops ---------------------------
 
+# Server-side chunking (schema.sql: SP_UpsertDocChunks) ships each body once
+# and builds the chunk rows inside IRIS. Flipped off for the rest of the run
+# on the first failed CALL (e.g. schema predates the procedure).
+_USE_SERVER_CHUNKING = os.getenv("SERVER_SIDE_CHUNKING", "1") == "1"
+
+
+_INSERT_CHUNKS_SQL = """
+    INSERT OR UPDATE Agent_Data.DocChunks
+        (DocID, ChunkIndex, StartPos, EndPos, Title, Heading, ChunkText, ContentHash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+# Rows per executemany flush in the client-side path: keeps peak memory
+# constant for arbitrarily large documents.
+_UPSERT_BATCH = 500
+
+
 def upsert_doc_chunks(db: IRISClient, doc_id: str, title: str, body: str) -> int:
     """Upsert chunks into Agent_Data.DocChunks using (DocID, ChunkIndex) as natural key."""
-    chunks = make_chunks(body)
+    global _USE_SERVER_CHUNKING
+    if _USE_SERVER_CHUNKING:
+        try:
+            db.execute(
+                "CALL Agent_Data.SP_UpsertDocChunks(?, ?, ?, ?, ?)",
+                [doc_id, title, body, CHUNK_SIZE, CHUNK_OVERLAP],
+            )
+            return _chunk_count(len(body))
+        except Exception as e:
+            _USE_SERVER_CHUNKING = False
+            print(f"[warn] SP_UpsertDocChunks unavailable, chunking client-side: {e}")
+    # Upsert via INSERT OR UPDATE using the UNIQUE (DocID, ChunkIndex);
+    # chunks stream straight from the make_chunks generator into executemany
+    # batches, so only _UPSERT_BATCH rows are ever held in memory.
+    # ContentHash lets the vector rebuild skip chunks whose text is unchanged.
     count = 0
-    for idx, (start, end, chunk) in enumerate(chunks):
-        # Upsert via INSERT OR UPDATE using the UNIQUE (DocID, ChunkIndex)
-        db.execute(
-            """
-            INSERT OR UPDATE Agent_Data.DocChunks
-                (DocID, ChunkIndex, StartPos, EndPos, Title, Heading, ChunkText)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            [doc_id, idx, start, end, title, None, chunk],
+    params: List[Tuple[Any, ...]] = []
+    for idx, (start, end, chunk) in enumerate(make_chunks(body)):
+        params.append(
+            (doc_id, idx, start, end, title, None, chunk,
+             hashlib.sha256(chunk.encode()).hexdigest())
         )
-        count += 1
+        if len(params) >= _UPSERT_BATCH:
+            db.executemany(_INSERT_CHUNKS_SQL, params)
+            count += len(params)
+            params.clear()
+    if params:
+        db.executemany(_INSERT_CHUNKS_SQL, params)
+        count += len(params)
+    # Drop the stale tail, mirroring SP_UpsertDocChunks: rows past the new
+    # chunk count linger otherwise (doc shrank, or was ingested before the
+    # fast path stopped emitting a redundant trailing window for bodies
+    # between step and size characters).
+    db.execute(
+        "DELETE FROM Agent_Data.DocChunks WHERE DocID = ? AND ChunkIndex >= ?",
+        [doc_id, count],
+    )
     return count
 
 
-def rebuild_doc_chunk_vectors(db: IRISClient, config: str) -> None:
-    cfg = _validate_config_name(config)
-    # Rebuild all (simple & deterministic). Change to WHERE Embedding IS NULL for incremental.
-    db.execute(
-        f"""
-        UPDATE Agent_Data.DocChunks c
-        SET Embedding = EMBEDDING(c.ChunkText, '{cfg}')
-        """
-    )
+_STALE_CHUNKS_SQL = """
+    SELECT ChunkID, ChunkText, ContentHash FROM Agent_Data.DocChunks
+    WHERE Embedding IS NULL OR EmbeddedHash IS NULL OR EmbeddedHash <> ContentHash
+    ORDER BY ChunkID
+    """
+
+_STALE_BY_HASH_SQL = """
+    UPDATE Agent_Data.DocChunks
+    SET Embedding = TO_VECTOR(?, FLOAT), EmbeddedHash = ContentHash
+    WHERE ContentHash = ?
+      AND (Embedding IS NULL OR EmbeddedHash IS NULL OR EmbeddedHash <> ContentHash)
+    """
+
+_STALE_BY_ID_SQL = """
+    UPDATE Agent_Data.DocChunks
+    SET Embedding = TO_VECTOR(?, FLOAT), EmbeddedHash = ContentHash
+    WHERE ChunkID = ?
+    """
+
+
+def _rebuild_doc_chunk_vectors_client(db: IRISClient, chunk: int) -> None:
+    """Embed stale chunks with direct batched OpenAI calls (one request per
+    `chunk` texts, via the persistent agent/embed_cache) and bind the vectors
+    back with a single executemany UPDATE per batch. Identical texts across
+    docs (boilerplate headers, repeated policy paragraphs) are embedded once:
+    unique ContentHash values go to the provider, and the UPDATE fans the
+    vector out to every chunk row sharing that hash."""
+    unique: Dict[str, str] = {}     # ContentHash -> text, first-seen order
+    legacy: List[Tuple[Any, str]] = []  # pre-hash rows, updated by ChunkID
+    total = 0
+    for r in db.query(_STALE_CHUNKS_SQL):
+        total += 1
+        if r.ContentHash:
+            unique.setdefault(r.ContentHash, r.ChunkText)
+        else:
+            legacy.append((r.ChunkID, r.ChunkText))
+    if not total:
+        print("[info]   doc chunk embeddings up to date (0 changed)")
+        return
+
+    hashed = list(unique.items())
+    print(f"[info]   {total} stale chunks -> {len(hashed) + len(legacy)} embedding inputs after dedup")
+    done = 0
+    for i in range(0, len(hashed), chunk):
+        batch = hashed[i : i + chunk]
+        vecs = embed_cache.embed_many([text for _, text in batch])
+        db.executemany(_STALE_BY_HASH_SQL, [(vec, h) for (h, _), vec in zip(batch, vecs)])
+        done += len(batch)
+        print(f"[info]   unique chunk texts embedded (client-side): {done}/{len(hashed)}")
+    for i in range(0, len(legacy), chunk):
+        batch = legacy[i : i + chunk]
+        vecs = embed_cache.embed_many([text for _, text in batch])
+        db.executemany(_STALE_BY_ID_SQL, [(vec, cid) for (cid, _), vec in zip(batch, vecs)])
+
+
+def rebuild_doc_chunk_vectors(db: IRISClient, config: str, chunk: int = 100) -> None:
+    """Re-embed only chunks whose text changed since their vector was built,
+    `chunk` rows per UPDATE so no single statement (or its transaction/
+    journal footprint) grows with the corpus. With an OpenAI key present the
+    texts are embedded client-side in batched provider calls; otherwise each
+    batch is updated in-place via EMBEDDING() inside IRIS."""
+    if embed_cache.enabled():
+        try:
+            _rebuild_doc_chunk_vectors_client(db, chunk)
+            return
+        except Exception as e:
+            print(f"[warn] client-side embedding failed, using EMBEDDING(): {e}")
+    cfg = validate_config_name(config)
+    ids = [r.ChunkID for r in db.query(_STALE_CHUNKS_SQL)]
+    if not ids:
+        print("[info]   doc chunk embeddings up to date (0 changed)")
+        return
+    for i in range(0, len(ids), chunk):
+        batch = ids[i : i + chunk]
+        placeholders = ", ".join("?" * len(batch))
+        db.execute(
+            f"""
+            UPDATE Agent_Data.DocChunks c
+            SET Embedding = EMBEDDING(c.ChunkText, '{cfg}'),
+                EmbeddedHash = c.ContentHash
+            WHERE c.ChunkID IN ({placeholders})
+            """,
+            batch,
+        )
+        print(f"[info]   doc chunks embedded: {i + len(batch)}/{len(ids)}")
 
 
-def rebuild_product_vectors(db: IRISClient, config: str) -> None:
-    cfg = _validate_config_name(config)
-    db.execute(
-        f"""
-        UPDATE Agent_Data.Products p
-        SET Embedding = EMBEDDING(p.Name || ' ' || COALESCE(p.Description,''), '{cfg}')
+def rebuild_product_vectors(db: IRISClient, config: str, chunk: int = 100) -> None:
+    """Re-embed only products whose Name/Description changed since their
+    vector was built. Product rows are loaded via SQL scripts (not this
+    ingest path), so the content hash is computed client-side here. Takes
+    the same client-side vs EMBEDDING() route as the doc chunks, so product
+    and doc vectors always come from the same model as the query vectors."""
+    cfg = validate_config_name(config)
+    rows = db.query(
+        """
+        SELECT ProductID, Name, Description, ContentHash,
+               CASE WHEN Embedding IS NULL THEN 1 ELSE 0 END AS NeedsVec
+        FROM Agent_Data.Products
+        ORDER BY ProductID
         """
     )
+    # Same text the EMBEDDING() call below sees: Name || ' ' || COALESCE(Description,'')
+    stale = []
+    for r in rows:
+        text = f"{r.Name or ''} {r.Description or ''}"
+        h = hashlib.sha256(text.encode()).hexdigest()
+        if r.NeedsVec or r.ContentHash != h:
+            stale.append((h, r.ProductID, text))
+    if not stale:
+        print("[info]   product embeddings up to date (0 changed)")
+        return
+
+    if embed_cache.enabled():
+        try:
+            for i in range(0, len(stale), chunk):
+                batch = stale[i : i + chunk]
+                vecs = embed_cache.embed_many([text for _, _, text in batch])
+                db.executemany(
+                    """
+                    UPDATE Agent_Data.Products
+                    SET Embedding = TO_VECTOR(?, FLOAT), ContentHash = ?
+                    WHERE ProductID = ?
+                    """,
+                    [(vec, h, pid) for (h, pid, _), vec in zip(batch, vecs)],
+                )
+                print(f"[info]   products embedded (client-side): {min(i + chunk, len(stale))}/{len(stale)}")
+            return
+        except Exception as e:
+            print(f"[warn] client-side embedding failed, using EMBEDDING(): {e}")
+
+    sql = f"""
+        UPDATE Agent_Data.Products
+        SET Embedding = EMBEDDING(Name || ' ' || COALESCE(Description,''), '{cfg}'),
+            ContentHash = ?
+        WHERE ProductID = ?
+        """
+    for i in range(0, len(stale), chunk):
+        db.executemany(sql, [(h, pid) for h, pid, _ in stale[i : i + chunk]])
+        print(f"[info]   products embedded: {min(i + chunk, len(stale))}/{len(stale)}")
 
 
 # ---------------------------- Main ----------------------------
@@ -137,10 +383,13 @@ def main() -> int:
     db = IRISClient()
 
     # 1) Load & chunk files → upsert into DocChunks
-    docs = _read_docs_from_fs(DOCS_DIR)
+    # One transaction for the whole run: a single commit instead of per-row.
+    docs, new_manifest = _read_docs_from_fs(DOCS_DIR, _load_manifest())
     total_chunks = 0
-    for d in docs:
-        total_chunks += upsert_doc_chunks(db, d["DocID"], d["Title"], d["Body"])
+    with db.transaction():
+        for d in docs:
+            total_chunks += upsert_doc_chunks(db, d["DocID"], d["Title"], d["Body"])
+    _save_manifest(new_manifest)
     print(f"[ok] upserted {total_chunks} chunks across {len(docs)} docs")
 
     # 2) Build vectors inside IRIS
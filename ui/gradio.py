@@ -1,104 +1,197 @@
 # ui/gradio.py
 from __future__ import annotations
+import html
 import os
-import io
 import re
-import contextlib
+import threading
 import gradio as gr
-from agent.customer_support_agent import CustomerSupportAgent
+from cachetools import TTLCache
+from agent.customer_support_agent import CustomerSupportAgent, get_agent
 
 from dotenv import load_dotenv
 load_dotenv()
 
-_AGENT: CustomerSupportAgent | None = None
 def _agent() -> CustomerSupportAgent:
-    global _AGENT
-    if _AGENT is None:
-        if not os.getenv("OPENAI_API_KEY"):
-            raise RuntimeError("OPENAI_API_KEY is not set.")
-        _AGENT = CustomerSupportAgent()
-    return _AGENT
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY is not set.")
+    return get_agent()
 
-def format_debug_output(debug_text: str) -> str:
-    """Format debug output with colors and structure using HTML/CSS"""
-    if not debug_text.strip():
-        return '<div style="color: #666; font-style: italic;">No debug information available.</div>'
-    
-    # Split into lines and process
-    lines = debug_text.split('\n')
-    formatted_lines = ['<div style="font-family: monospace; line-height: 1.6;">']
-    
+def _warm_agent() -> None:
+    """Construct the agent at startup so the first request doesn't pay for it."""
+    try:
+        _agent()
+    except Exception:
+        pass  # e.g. no API key yet; the request path reports the real error
+
+# Syntax-highlighting patterns, compiled once at import instead of re-parsed
+# (or fetched from re's lock-guarded cache) for every code-block line.
+_KW_RE = re.compile(r'\b(def|class|import|from|return|if|else|elif|for|while|try|except|with|as)\b')
+_NUM_RE = re.compile(r'(\d+)')
+_STR_RE = re.compile(r'(["\'])([^"\']*)\1')
+
+# One precomputed HTML template per line kind; the matching predicate gets
+# (line, line.lower()) so each test is a plain substring check.
+_STEP_TMPL = '<div style="color: #2196F3; font-weight: bold; margin: 8px 0; padding: 4px; border-left: 3px solid #2196F3; padding-left: 8px;">🔄 {}</div>'
+_TOOL_TMPL = '<div style="color: #4CAF50; font-weight: bold; padding: 4px; border-left: 3px solid #4CAF50; padding-left: 8px;">🔧 {}</div>'
+_ERROR_TMPL = '<div style="color: #F44336; font-weight: bold; padding: 4px; border-left: 3px solid #F44336; padding-left: 8px;">❌ {}</div>'
+_RESULT_TMPL = '<div style="color: #9C27B0; padding: 4px; border-left: 3px solid #9C27B0; padding-left: 8px;">📊 {}</div>'
+_THINK_TMPL = '<div style="color: #FF9800; font-style: italic; padding: 4px;">💭 {}</div>'
+_PLAIN_TMPL = '<div style="color: #333; padding: 2px;">{}</div>'
+_PRE_OPEN = '<pre style="background: #1e1e1e; color: #d4d4d4; padding: 12px; border-radius: 4px; margin: 8px 0; overflow-x: auto;">'
+
+_LINE_STYLES = [
+    # Agent steps
+    (lambda line, low: 'Step' in line and (':' in line or 'step' in low), _STEP_TMPL),
+    # Tool calls
+    (lambda line, low: 'Tool:' in line or 'calling tool' in low or 'using tool' in low, _TOOL_TMPL),
+    # Errors
+    (lambda line, low: 'error' in low or 'exception' in low or 'failed' in low, _ERROR_TMPL),
+    # Results
+    (lambda line, low: 'result' in low or 'output' in low or 'response' in low, _RESULT_TMPL),
+    # Agent thinking
+    (lambda line, low: 'thinking' in low or 'reasoning' in low, _THINK_TMPL),
+]
+
+_WRAP_OPEN = '<div style="font-family: monospace; line-height: 1.6;">'
+_NO_DEBUG = '<div style="color: #666; font-style: italic;">No debug information available.</div>'
+
+# Single-pass HTML escape (str.translate runs in C); also escapes '&', which
+# the old chained .replace missed, so literal '&amp;' no longer renders mangled.
+_ESC = {ord('&'): '&amp;', ord('<'): '&lt;', ord('>'): '&gt;'}
+
+
+def _escape(text: str) -> str:
+    return text.translate(_ESC)
+
+
+def _format_debug_lines(lines):
+    """Yield one HTML fragment per debug line (joined once by the caller)."""
     in_code_block = False
-    
-    for line in lines:
-        original_line = line
-        line = line.strip()
-        
+    for original_line in lines:
+        line = original_line.strip()
+
         if not line:
-            formatted_lines.append('<br>')
+            yield '<br>'
             continue
-        
+
         # Handle code blocks
         if line.startswith('```'):
-            if in_code_block:
-                formatted_lines.append('</pre>')
-                in_code_block = False
-            else:
-                formatted_lines.append('<pre style="background: #1e1e1e; color: #d4d4d4; padding: 12px; border-radius: 4px; margin: 8px 0; overflow-x: auto;">')
-                in_code_block = True
+            yield '</pre>' if in_code_block else _PRE_OPEN
+            in_code_block = not in_code_block
             continue
-        
+
         if in_code_block:
             # Inside code block - preserve formatting and add syntax highlighting
-            escaped_line = original_line.replace('<', '&lt;').replace('>', '&gt;')
+            escaped_line = original_line.translate(_ESC)
             # Basic Python syntax highlighting
-            escaped_line = re.sub(r'\b(def|class|import|from|return|if|else|elif|for|while|try|except|with|as)\b', 
-                                r'<span style="color: #569cd6;">\1</span>', escaped_line)
-            escaped_line = re.sub(r'(\d+)', r'<span style="color: #b5cea8;">\1</span>', escaped_line)
-            escaped_line = re.sub(r'(["\'])([^"\']*)\1', r'<span style="color: #ce9178;">\1\2\1</span>', escaped_line)
-            formatted_lines.append(escaped_line)
+            escaped_line = _KW_RE.sub(r'<span style="color: #569cd6;">\1</span>', escaped_line)
+            escaped_line = _NUM_RE.sub(r'<span style="color: #b5cea8;">\1</span>', escaped_line)
+            escaped_line = _STR_RE.sub(r'<span style="color: #ce9178;">\1\2\1</span>', escaped_line)
+            yield escaped_line
             continue
-        
-        # Outside code blocks - format different types of output
-        if 'Step' in line and (':' in line or 'step' in line.lower()):
-            # Agent steps
-            formatted_lines.append(f'<div style="color: #2196F3; font-weight: bold; margin: 8px 0; padding: 4px; border-left: 3px solid #2196F3; padding-left: 8px;">🔄 {line}</div>')
-        elif 'Tool:' in line or 'calling tool' in line.lower() or 'using tool' in line.lower():
-            # Tool calls
-            formatted_lines.append(f'<div style="color: #4CAF50; font-weight: bold; padding: 4px; border-left: 3px solid #4CAF50; padding-left: 8px;">🔧 {line}</div>')
-        elif 'error' in line.lower() or 'exception' in line.lower() or 'failed' in line.lower():
-            # Errors
-            formatted_lines.append(f'<div style="color: #F44336; font-weight: bold; padding: 4px; border-left: 3px solid #F44336; padding-left: 8px;">❌ {line}</div>')
-        elif 'result' in line.lower() or 'output' in line.lower() or 'response' in line.lower():
-            # Results
-            formatted_lines.append(f'<div style="color: #9C27B0; padding: 4px; border-left: 3px solid #9C27B0; padding-left: 8px;">📊 {line}</div>')
-        elif 'thinking' in line.lower() or 'reasoning' in line.lower():
-            # Agent thinking
-            formatted_lines.append(f'<div style="color: #FF9800; font-style: italic; padding: 4px;">💭 {line}</div>')
+
+        # Outside code blocks - escape once (C loop; the style keywords
+        # contain no markup, so dispatch on the escaped line is unchanged),
+        # then first matching style wins. Raw '<'/'>' from agent output used
+        # to land in the HTML unescaped here.
+        line = html.escape(line, quote=False)
+        low = line.lower()
+        for cond, tmpl in _LINE_STYLES:
+            if cond(line, low):
+                yield tmpl.format(line)
+                break
         else:
             # Regular text
-            formatted_lines.append(f'<div style="color: #333; padding: 2px;">{line}</div>')
-    
+            yield _PLAIN_TMPL.format(line)
+
     if in_code_block:
-        formatted_lines.append('</pre>')
-    
-    formatted_lines.append('</div>')
-    return ''.join(formatted_lines)
+        yield '</pre>'
+
+
+def format_debug_output(debug_text: str) -> str:
+    """Format captured stdout-style debug text with colors using HTML/CSS"""
+    if not debug_text.strip():
+        return _NO_DEBUG
+    return ''.join((_WRAP_OPEN, *_format_debug_lines(debug_text.split('\n')), '</div>'))
+
+
+def _format_event_fragments(events):
+    for ev in events:
+        step = ev.get('step')
+        if step is not None:
+            yield _STEP_TMPL.format(f'Step {step}')
+        thought = ev.get('thought')
+        if thought:
+            # Model output may contain ``` fences; reuse the line formatter
+            # so code keeps its highlighting.
+            yield from _format_debug_lines(thought.split('\n'))
+        for call in ev.get('tool_calls') or ():
+            name = call.get('name') or 'tool'
+            yield _TOOL_TMPL.format(f'Calling tool: {_escape(str(name))}')
+            args = call.get('args')
+            if args:
+                yield _PRE_OPEN
+                yield _escape(str(args))
+                yield '</pre>'
+        observation = ev.get('observation')
+        if observation:
+            yield _RESULT_TMPL.format('Output:')
+            yield _PRE_OPEN
+            yield _escape(observation)
+            yield '</pre>'
+        error = ev.get('error')
+        if error:
+            yield _ERROR_TMPL.format(_escape(error))
+
+
+def format_debug_events(events: list) -> str:
+    """
+    Render the structured step events collected by CustomerSupportAgent.run's
+    debug_sink: a pure function over dicts, no stdout scraping or re-parsing.
+    """
+    if not events:
+        return _NO_DEBUG
+    return ''.join((_WRAP_OPEN, *_format_event_fragments(events), '</div>'))
+
+# Repeat questions (e.g. the sample-prompt buttons) skip the whole agent run
+# for 5 minutes. Prefix a message with '!' to bypass the cache and recompute.
+# TTLCache mutates internal state even on reads, so every access holds the
+# lock (gradio handlers run on concurrent threads).
+_RESP_CACHE: TTLCache = TTLCache(maxsize=512, ttl=300)
+_RESP_LOCK = threading.Lock()
 
-def respond_with_debug(message: str, email: str):
+def respond_with_debug(message: str, email: str, want_debug: bool = True):
     if not email or "@" not in email:
         return "Please enter a valid email (e.g., alice@example.com).", ""
-    
-    # Always capture debug output
-    debug_output = io.StringIO()
-    with contextlib.redirect_stdout(debug_output), contextlib.redirect_stderr(debug_output):
-        answer = _agent()(user_email=email, message=message)["answer"]
-    
-    debug_text = debug_output.getvalue()
-    formatted_debug = format_debug_output(debug_text)
+
+    force = message.startswith("!")
+    if force:
+        message = message[1:]
+    key = (email, message.strip())
+    if not force:
+        with _RESP_LOCK:
+            cached = _RESP_CACHE.get(key)
+        # A hit cached while the panel was closed has no debug HTML; fall
+        # through and recompute if the caller wants the trace now.
+        if cached is not None and (not want_debug or cached[1]):
+            return cached if want_debug else (cached[0], "")
+
+    # Structured step events straight from agent memory: no stdout capture,
+    # no StringIO copy of every print, no regex re-parse of the transcript.
+    # With the debug panel collapsed, skip collection and formatting entirely.
+    events: list = [] if want_debug else None
+    answer = _agent().run(user_email=email, message=message, debug_sink=events)["answer"]
+
+    formatted_debug = format_debug_events(events) if want_debug else ""
+    with _RESP_LOCK:
+        _RESP_CACHE[key] = (answer, formatted_debug)
     return answer, formatted_debug
 
 def main():
+    # Warm the (lock-guarded) get_agent() singleton off the request thread:
+    # model/tool init overlaps server startup instead of stalling user one.
+    threading.Thread(target=_warm_agent, daemon=True).start()
+
     # Sample prompts for users to try
     SAMPLE_PROMPTS = [
         "Where is my order #1001?",
@@ -188,28 +281,33 @@ def main():
                     clear_btn = gr.Button("Clear")
             
             with gr.Column(scale=1):
-                gr.Markdown("### 🔍 Agent Debug Information")
-                gr.Markdown("*Real-time view of agent reasoning, tool calls, and execution steps*")
-                debug_display = gr.HTML(
-                    visible=True,
-                    elem_classes=["debug-container"]
-                )
-        
+                # Formatting is skipped entirely while the accordion is
+                # closed (the common case), so hidden traces cost nothing.
+                debug_open = gr.State(False)
+                with gr.Accordion("🔍 Agent Debug Information", open=False) as debug_accordion:
+                    gr.Markdown("*View of agent reasoning, tool calls, and execution steps*")
+                    debug_display = gr.HTML(
+                        visible=True,
+                        elem_classes=["debug-container"]
+                    )
+                debug_accordion.expand(lambda: True, outputs=[debug_open])
+                debug_accordion.collapse(lambda: False, outputs=[debug_open])
+
         def user_submit(message, history):
             if not message.strip():
                 return "", history, ""
-            
+
             history = history + [[message, None]]
             return "", history, ""
-        
-        def bot_respond(history, email):
+
+        def bot_respond(history, email, want_debug):
             if not history or history[-1][1] is not None:
                 return history, ""
-            
+
             user_message = history[-1][0]
-            bot_response, debug_info = respond_with_debug(user_message, email)
+            bot_response, debug_info = respond_with_debug(user_message, email, want_debug)
             history[-1][1] = bot_response
-            
+
             return history, debug_info
         
         
@@ -223,7 +321,7 @@ def main():
             outputs=[msg_input, chatbot, debug_display]
         ).then(
             bot_respond,
-            inputs=[chatbot, email_input],
+            inputs=[chatbot, email_input, debug_open],
             outputs=[chatbot, debug_display]
         )
         
@@ -233,7 +331,7 @@ def main():
             outputs=[msg_input, chatbot, debug_display]
         ).then(
             bot_respond,
-            inputs=[chatbot, email_input],
+            inputs=[chatbot, email_input, debug_open],
             outputs=[chatbot, debug_display]
         )
         
@@ -251,7 +349,7 @@ def main():
                 outputs=[msg_input, chatbot, debug_display]
             ).then(
                 bot_respond,
-                inputs=[chatbot, email_input],
+                inputs=[chatbot, email_input, debug_open],
                 outputs=[chatbot, debug_display]
             )
     
@@ -1,27 +1,54 @@
 # ui/gradio_simple.py
 from __future__ import annotations
 import os
+import threading
 import gradio as gr
-from agent.customer_support_agent import CustomerSupportAgent
+from cachetools import TTLCache
+from agent.customer_support_agent import CustomerSupportAgent, get_agent
 
 from dotenv import load_dotenv
 load_dotenv()
 
-_AGENT: CustomerSupportAgent | None = None
 def _agent() -> CustomerSupportAgent:
-    global _AGENT
-    if _AGENT is None:
-        if not os.getenv("OPENAI_API_KEY"):
-            raise RuntimeError("OPENAI_API_KEY is not set.")
-        _AGENT = CustomerSupportAgent()
-    return _AGENT
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY is not set.")
+    return get_agent()
+
+def _warm_agent() -> None:
+    """Construct the agent at startup so the first request doesn't pay for it."""
+    try:
+        _agent()
+    except Exception:
+        pass  # e.g. no API key yet; the request path reports the real error
+
+# Repeat questions skip the whole agent run for 5 minutes. Prefix a message
+# with '!' to bypass the cache and recompute. TTLCache mutates internal state
+# even on reads, so every access holds the lock (gradio handlers run on
+# concurrent threads).
+_RESP_CACHE: TTLCache = TTLCache(maxsize=512, ttl=300)
+_RESP_LOCK = threading.Lock()
 
 def respond(message: str, history: list[tuple[str, str]], email: str) -> str:
     if not email or "@" not in email:
         return "Please enter a valid email (e.g., alice@example.com)."
-    return _agent()(user_email=email, message=message)["answer"]
+    force = message.startswith("!")
+    if force:
+        message = message[1:]
+    key = (email, message.strip())
+    if not force:
+        with _RESP_LOCK:
+            cached = _RESP_CACHE.get(key)
+        if cached is not None:
+            return cached
+    answer = _agent()(user_email=email, message=message)["answer"]
+    with _RESP_LOCK:
+        _RESP_CACHE[key] = answer
+    return answer
 
 def main():
+    # Warm the (lock-guarded) get_agent() singleton off the request thread:
+    # model/tool init overlaps server startup instead of stalling user one.
+    threading.Thread(target=_warm_agent, daemon=True).start()
     email_box = gr.Textbox(label="Email", value="alice@example.com", placeholder="you@example.com")
     demo = gr.ChatInterface(
         fn=respond,